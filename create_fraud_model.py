@@ -1,51 +1,121 @@
+import io
+import os
+
 import numpy as np
+import onnx
+import onnxruntime as ort
+import tl2cgen
+import torch
+import treelite
+from hummingbird.ml import convert
+from onnxsim import simplify
 from sklearn.ensemble import RandomForestClassifier
-from skl2onnx import convert_sklearn
-from skl2onnx.common.data_types import FloatTensorType
 
 # Create sample fraud detection training data
 # Features: [amount, merchant_risk, account_age, txn_per_day, hour]
-X_train = np.array([
+_DATA = (
     # Legitimate transactions
-    [50.0, 0.2, 500.0, 3.0, 14.0],
-    [25.0, 0.1, 800.0, 1.0, 10.0],
-    [75.0, 0.3, 600.0, 5.0, 12.0],
-    [100.0, 0.2, 400.0, 4.0, 15.0],
-    [30.0, 0.1, 900.0, 2.0, 11.0],
-    [45.0, 0.2, 700.0, 3.0, 13.0],
-    [60.0, 0.3, 500.0, 4.0, 16.0],
-    [80.0, 0.2, 600.0, 3.0, 14.0],
+    50.0, 0.2, 500.0, 3.0, 14.0,
+    25.0, 0.1, 800.0, 1.0, 10.0,
+    75.0, 0.3, 600.0, 5.0, 12.0,
+    100.0, 0.2, 400.0, 4.0, 15.0,
+    30.0, 0.1, 900.0, 2.0, 11.0,
+    45.0, 0.2, 700.0, 3.0, 13.0,
+    60.0, 0.3, 500.0, 4.0, 16.0,
+    80.0, 0.2, 600.0, 3.0, 14.0,
 
     # Fraudulent transactions
-    [450.0, 0.8, 5.0, 45.0, 3.0],
-    [500.0, 0.9, 10.0, 50.0, 2.0],
-    [300.0, 0.7, 30.0, 25.0, 4.0],
-    [400.0, 0.8, 20.0, 30.0, 1.0],
-    [350.0, 0.9, 15.0, 40.0, 5.0],
-    [480.0, 0.8, 8.0, 48.0, 2.0],
-    [420.0, 0.7, 25.0, 35.0, 3.0],
-    [380.0, 0.9, 12.0, 42.0, 4.0],
-])
+    450.0, 0.8, 5.0, 45.0, 3.0,
+    500.0, 0.9, 10.0, 50.0, 2.0,
+    300.0, 0.7, 30.0, 25.0, 4.0,
+    400.0, 0.8, 20.0, 30.0, 1.0,
+    350.0, 0.9, 15.0, 40.0, 5.0,
+    480.0, 0.8, 8.0, 48.0, 2.0,
+    420.0, 0.7, 25.0, 35.0, 3.0,
+    380.0, 0.9, 12.0, 42.0, 4.0,
+)
+X_train = np.fromiter(_DATA, dtype=np.float32, count=80).reshape(16, 5)
 
 # Labels: 0 = legitimate, 1 = fraud
-y_train = np.array([0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 1, 1])
+y_train = np.zeros(16, dtype=np.int8)
+y_train[8:] = 1
 
 # Train fraud detection model
 print("Training fraud detection model...")
-model = RandomForestClassifier(n_estimators=10, max_depth=5, random_state=42)
+model = RandomForestClassifier(
+    n_estimators=10,
+    max_depth=5,
+    max_features=5,  # all 5 features; subsampling buys nothing here
+    bootstrap=False,  # 16 rows, resampling is pure overhead
+    n_jobs=-1,
+    random_state=42
+)
 model.fit(X_train, y_train)
 
 # Export to ONNX
+# Hummingbird lowers the forest to dense Gemm tensor ops instead of a
+# TreeEnsembleClassifier node walked one tree at a time, and its outputs are
+# plain label/probability tensors (no ZipMap). Convert to its PyTorch form and
+# export that ourselves: Hummingbird's own ONNX backend calls torch.onnx.export
+# without dynamo=False, which the dynamo exporter (default since PyTorch 2.9)
+# rejects, and which can't target an opset below 18 anyway.
 print("Exporting to ONNX format...")
-initial_type = [('float_input', FloatTensorType([None, 5]))]
-onnx_model = convert_sklearn(model, initial_types=initial_type)
+hb_model = convert(model, 'torch', extra_config={'tree_implementation': 'gemm'})
+onnx_buffer = io.BytesIO()
+torch.onnx.export(
+    hb_model.model,
+    torch.from_numpy(X_train[:1]),
+    onnx_buffer,
+    export_params=True,
+    opset_version=12,  # Pinned to match the vision models; honoured because dynamo=False
+    do_constant_folding=True,
+    keep_initializers_as_inputs=False,
+    dynamo=False,
+    input_names=['input'],
+    output_names=['label', 'probabilities'],
+    dynamic_axes={
+        'input': {0: 'batch_size'},
+        'label': {0: 'batch_size'},
+        'probabilities': {0: 'batch_size'}
+    }
+)
+onnx_model = onnx.load_from_string(onnx_buffer.getvalue())
+
+# Strip converter leftovers (Identity/Cast/Unsqueeze) with onnx-simplifier
+onnx_model, ok = simplify(onnx_model)
+assert ok, "onnxsim could not validate the simplified model"
 
-# Save
+# Save: the ORT session bakes in its basic graph optimizations and writes the
+# result straight to output_file, so the unoptimized bytes never hit disk
 output_file = "fraud_model.onnx"
-with open(output_file, "wb") as f:
-    f.write(onnx_model.SerializeToString())
+so = ort.SessionOptions()
+so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+so.optimized_model_filepath = output_file
+ort.InferenceSession(onnx_model.SerializeToString(), so, providers=["CPUExecutionProvider"])
+
+# ORT stamps every domain it has registered (ai.onnx.ml, com.microsoft, ...)
+# into opset_import; keep only the ones the nodes actually use
+optimized = onnx.load(output_file)
+used = {node.domain for node in optimized.graph.node}
+kept = [opset for opset in optimized.opset_import if opset.domain in ('', 'ai.onnx') or opset.domain in used]
+del optimized.opset_import[:]
+optimized.opset_import.extend(kept)
+onnx.save(optimized, output_file)
 
 print(f"✓ Successfully saved {output_file}")
-print(f"  Model size: {len(onnx_model.SerializeToString()) / 1024:.2f} KB")
+print(f"  Model size: {os.path.getsize(output_file) / 1024:.2f} KB")
+
+# Also compile the forest to a native shared library for low-latency serving.
+# ONNX stays the artifact for the zkML verifier; the .so is a straight-line
+# C if-tree with no runtime dispatch. (Treelite's compiler lives in tl2cgen.)
+print("Compiling native shared library...")
+lib_file = "fraud_model.so"
+tl2cgen.export_lib(
+    treelite.sklearn.import_model(model),
+    toolchain='gcc',
+    libpath=f"./{lib_file}",
+    params={'quantize': 1}
+)
+print(f"✓ Successfully saved {lib_file}")
 print(f"\nYou can now upload this model to the zkML ONNX Verifier UI!")
 print(f"Test it with the pre-built scenarios in the UI.")
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 """Create a simple ONNX model compatible with onnxruntime-node"""
 
+import os
+
+import onnx
+import onnxruntime as ort
 import torch
 import torch.nn as nn
 import torch.onnx
+from onnxsim import simplify
 
 # Simple neural network for testing
 class SimpleModel(nn.Module):
@@ -12,13 +17,11 @@ class SimpleModel(nn.Module):
         self.fc1 = nn.Linear(5, 8)
         self.relu = nn.ReLU()
         self.fc2 = nn.Linear(8, 2)
-        self.softmax = nn.Softmax(dim=1)
 
     def forward(self, x):
         x = self.fc1(x)
         x = self.relu(x)
         x = self.fc2(x)
-        x = self.softmax(x)
         return x
 
 # Create model
@@ -26,7 +29,7 @@ model = SimpleModel()
 model.eval()
 
 # Example input
-dummy_input = torch.randn(1, 5)
+dummy_input = torch.zeros(1, 5)  # Values are irrelevant for tracing
 
 # Export to ONNX with IR version 7 (compatible with onnxruntime-node)
 torch.onnx.export(
@@ -36,6 +39,9 @@ torch.onnx.export(
     export_params=True,
     opset_version=11,  # Use opset 11 for better compatibility
     do_constant_folding=True,
+    training=torch.onnx.TrainingMode.EVAL,
+    keep_initializers_as_inputs=False,
+    dynamo=False,  # TorchScript exporter; the dynamo one can't target opset < 18
     input_names=['input'],
     output_names=['output'],
     dynamic_axes={
@@ -44,7 +50,29 @@ torch.onnx.export(
     }
 )
 
+# Strip tracer leftovers (Identity/Cast/Unsqueeze) with onnx-simplifier
+model_sim, ok = simplify(onnx.load("test_model_compatible.onnx"))
+assert ok, "onnxsim could not validate the simplified model"
+onnx.save(model_sim, "test_model_compatible.onnx")
+
+# Bake ONNX Runtime's basic graph optimizations into the file
+so = ort.SessionOptions()
+so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+so.optimized_model_filepath = "test_model_compatible.onnx.opt"
+ort.InferenceSession("test_model_compatible.onnx", so, providers=["CPUExecutionProvider"])
+
+# ORT stamps every domain it has registered (ai.onnx.ml, com.microsoft, ...)
+# into opset_import; keep only the ones the nodes actually use
+optimized = onnx.load("test_model_compatible.onnx.opt")
+used = {node.domain for node in optimized.graph.node}
+kept = [opset for opset in optimized.opset_import if opset.domain in ('', 'ai.onnx') or opset.domain in used]
+del optimized.opset_import[:]
+optimized.opset_import.extend(kept)
+onnx.save(optimized, "test_model_compatible.onnx")
+os.remove("test_model_compatible.onnx.opt")
+
 print("✅ Created test_model_compatible.onnx")
 print("   Model: 5 inputs → 8 hidden → 2 outputs")
+print("   Output: returns logits; apply softmax in client if probabilities are required")
 print("   Opset version: 11")
 print("   Test input: [0.5, 0.3, 0.8, 0.2, 0.6]")
@@ -4,9 +4,25 @@ Create simple, working ONNX vision models for the demo.
 These are guaranteed to work with ONNX Runtime (unlike downloaded models which may have compatibility issues).
 """
 
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import onnx
+import onnx.version_converter
+import onnxruntime as ort
+from onnx import helper, numpy_helper
 import torch
 import torch.nn as nn
 import torch.onnx
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+from onnxsim import simplify
 
 # Simple CNN for 28x28 grayscale images (MNIST-style)
 class SimpleCNN(nn.Module):
@@ -89,7 +105,11 @@ class TinyMobileNet(nn.Module):
             nn.BatchNorm2d(32),
             nn.ReLU(),
 
-            # Depthwise separable convolutions
+            # Depthwise separable convolutions. These stay NCHW in the file: the
+            # blocked-layout (NCHWc) rewrite that speeds them up on CPU is
+            # hardware specific, so it is left to the consuming session. Create
+            # it with graph optimization level ORT_ENABLE_ALL (the default in
+            # onnxruntime-node, which server.js uses) to get it.
             nn.Conv2d(32, 32, 3, groups=32, padding=1),
             nn.BatchNorm2d(32),
             nn.ReLU(),
@@ -114,61 +134,204 @@ class TinyMobileNet(nn.Module):
         x = self.classifier(x)
         return x
 
-def export_model(model, dummy_input, filename, model_name):
-    """Export PyTorch model to ONNX"""
+# Export settings shared by every model
+onnx_export = functools.partial(
+    torch.onnx.export,
+    export_params=True,
+    opset_version=12,  # Compatible with most ONNX Runtime versions
+    do_constant_folding=True,
+    training=torch.onnx.TrainingMode.EVAL,  # No BatchNorm training-mode branches
+    keep_initializers_as_inputs=False,
+    dynamo=False,  # TorchScript exporter; the dynamo one can't target opset < 18
+    input_names=['input'],
+    output_names=['output'],
+    dynamic_axes={
+        'input': {0: 'batch_size'},
+        'output': {0: 'batch_size'}
+    }
+)
+
+class RandomCalibrationDataReader(CalibrationDataReader):
+    """Feeds random tensors of the model's input shape to the INT8 calibrator"""
+    def __init__(self, input_shape, num_samples=50):
+        self.input_shape = input_shape
+        self.remaining = num_samples
+
+    def get_next(self):
+        if self.remaining == 0:
+            return None
+        self.remaining -= 1
+        return {'input': torch.randn(*self.input_shape).numpy()}
+
+def fuse_conv_bn(model):
+    """Fold each BatchNorm2d into the Conv2d defined just before it
+
+    Pairs are matched by module registration order, not by tracing forward(),
+    so this only supports models whose definition order matches their forward
+    order (true for every model in this file).
+    """
+    leaves = [(name, module) for name, module in model.named_modules()
+              if not list(module.children())]
+    for (_, conv), (bn_name, bn) in zip(leaves, leaves[1:]):
+        if not (isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d)):
+            continue
+
+        # W' = W * gamma / sqrt(var + eps), b' = (b - mean) * gamma / sqrt(var + eps) + beta
+        with torch.no_grad():
+            scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+            bias = conv.bias if conv.bias is not None else torch.zeros(conv.out_channels)
+            conv.weight.mul_(scale.reshape(-1, 1, 1, 1))
+            conv.bias = nn.Parameter(scale * (bias - bn.running_mean) + bn.bias)
+
+        parent_name, _, child_name = bn_name.rpartition('.')
+        setattr(model.get_submodule(parent_name), child_name, nn.Identity())
+
+def prune_opset_imports(onnx_model):
+    """Drop opset_import entries for domains no node uses
+
+    ONNX Runtime's optimized_model_filepath output declares every domain it
+    has registered (ai.onnx.ml, com.microsoft, ...), which older runtimes and
+    the prover reject even though the graph only uses default-domain ops.
+    """
+    used = {node.domain for node in onnx_model.graph.node}
+    kept = [opset for opset in onnx_model.opset_import
+            if opset.domain in ('', 'ai.onnx') or opset.domain in used]
+    del onnx_model.opset_import[:]
+    onnx_model.opset_import.extend(kept)
+    return onnx_model
+
+def gemm_to_matmul(onnx_model):
+    """Rewrite constant-weight Gemm nodes as MatMul + Add
+
+    ONNX Runtime's dynamic quantizer only has integer kernels registered for
+    MatMul, so Linear layers exported as Gemm would otherwise stay FP32.
+    """
+    weights = {init.name: init for init in onnx_model.graph.initializer}
+    nodes = []
+    for node in onnx_model.graph.node:
+        attrs = {attr.name: helper.get_attribute_value(attr) for attr in node.attribute}
+        if (node.op_type != 'Gemm' or node.input[1] not in weights
+                or attrs.get('alpha', 1.0) != 1.0 or attrs.get('beta', 1.0) != 1.0
+                or attrs.get('transA', 0)):
+            nodes.append(node)
+            continue
+
+        if attrs.get('transB', 0):
+            weight = weights[node.input[1]]
+            weight.CopyFrom(numpy_helper.from_array(numpy_helper.to_array(weight).T.copy(), weight.name))
+
+        has_bias = len(node.input) > 2 and node.input[2]
+        matmul_out = node.output[0] + '_matmul' if has_bias else node.output[0]
+        nodes.append(helper.make_node('MatMul', node.input[:2], [matmul_out], name=node.name + '_matmul'))
+        if has_bias:
+            nodes.append(helper.make_node('Add', [matmul_out, node.input[2]], node.output, name=node.name + '_bias'))
+
+    del onnx_model.graph.node[:]
+    onnx_model.graph.node.extend(nodes)
+    return onnx_model
+
+def export_model(model, dummy_input, filename, model_name, dynamic_batch=True):
+    """Export PyTorch model to ONNX (dynamic_batch=False fixes the batch dim to the dummy's)"""
     model.eval()
 
+    # Fold BatchNorm into the preceding conv weights so no BatchNormalization
+    # nodes survive into the exported graph
+    fuse_conv_bn(model)
+
     with torch.no_grad():
-        torch.onnx.export(
-            model,
-            dummy_input,
-            filename,
-            export_params=True,
-            opset_version=12,  # Compatible with most ONNX Runtime versions
-            do_constant_folding=True,
-            input_names=['input'],
-            output_names=['output'],
-            dynamic_axes={
-                'input': {0: 'batch_size'},
-                'output': {0: 'batch_size'}
-            }
-        )
+        if dynamic_batch:
+            onnx_export(model, dummy_input, filename)
+        else:
+            onnx_export(model, dummy_input, filename, dynamic_axes=None)
+
+    # Verify the exported model (path form: checked without loading it into Python)
+    onnx.checker.check_model(filename)
 
-    # Verify the exported model
-    import onnx
-    onnx_model = onnx.load(filename)
-    onnx.checker.check_model(onnx_model)
+    # Strip tracer leftovers (Identity/Cast/Unsqueeze) with onnx-simplifier
+    model_sim, ok = simplify(onnx.load(filename))
+    assert ok, f"onnxsim could not validate the simplified {model_name}"
+    onnx.save(model_sim, filename)
+
+    # Bake ONNX Runtime's graph optimizations (constant folding, redundant
+    # node elimination, Conv/Gemm fusions) into the file. BASIC keeps the graph
+    # in standard ONNX ops; higher levels emit contrib ops and
+    # hardware-specific layouts that other runtimes can't load.
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+    so.optimized_model_filepath = filename + ".opt"
+    ort.InferenceSession(filename, so, providers=["CPUExecutionProvider"])
+    onnx.save(prune_opset_imports(onnx.load(filename + ".opt")), filename)
+    os.remove(filename + ".opt")
 
     # Get file size
-    import os
     size_mb = os.path.getsize(filename) / (1024 * 1024)
     print(f"✓ {model_name} exported: {filename} ({size_mb:.2f} MB)")
 
+    # Static INT8 (QDQ) copy alongside the FP32 fallback. Per-channel
+    # DequantizeLinear needs the axis attribute from opset 13, so this copy
+    # is converted up from the opset-12 FP32 graph.
+    int8_filename = filename.replace('.onnx', '_int8.onnx')
+    quantize_static(
+        onnx.version_converter.convert_version(onnx.load(filename), 13),
+        int8_filename,
+        RandomCalibrationDataReader(tuple(dummy_input.shape)),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QInt8,
+        weight_type=QuantType.QInt8
+    )
+    size_mb = os.path.getsize(int8_filename) / (1024 * 1024)
+    print(f"✓ {model_name} INT8 exported: {int8_filename} ({size_mb:.2f} MB)")
+
+    # Weight-only INT8 for the Linear classifier head; convs and activations
+    # stay FP32, so no calibration is needed
+    dynq_filename = filename.replace('.onnx', '_dynq.onnx')
+    quantize_dynamic(
+        gemm_to_matmul(onnx.load(filename)),
+        dynq_filename,
+        weight_type=QuantType.QInt8,
+        op_types_to_quantize=['MatMul'],
+        per_channel=False
+    )
+    size_mb = os.path.getsize(dynq_filename) / (1024 * 1024)
+    print(f"✓ {model_name} dynamic INT8 exported: {dynq_filename} ({size_mb:.2f} MB)")
+
+def export_variants(job):
+    """Build one architecture and export its batch-1 and dynamic-batch graphs"""
+    model_cls, input_shape, basename, model_name = job
+    model = model_cls()
+    # Only a shape/dtype carrier for tracing
+    dummy_input = torch.zeros(*input_shape)
+    export_model(model, dummy_input, f"{basename}.onnx", model_name, dynamic_batch=False)
+    export_model(model, dummy_input, f"{basename}_dyn.onnx", model_name)
+
 if __name__ == "__main__":
     print("Creating simple, compatible ONNX vision models...\n")
 
-    # 1. SimpleCNN for MNIST-style images
-    print("1. Creating SimpleCNN (grayscale images)...")
-    simple_cnn = SimpleCNN()
-    dummy_mnist = torch.randn(1, 1, 28, 28)
-    export_model(simple_cnn, dummy_mnist, "simple_cnn.onnx", "SimpleCNN")
-
-    # 2. Tiny ResNet for ImageNet-style images
-    print("\n2. Creating TinyResNet (RGB images)...")
-    tiny_resnet = TinyResNet()
-    dummy_imagenet = torch.randn(1, 3, 224, 224)
-    export_model(tiny_resnet, dummy_imagenet, "tiny_resnet.onnx", "TinyResNet")
+    # Each model is exported twice: a fixed batch-1 graph under the canonical
+    # name the UI loads (simple_cnn.onnx, ...) for the common single-image path,
+    # which lets the runtime pick shape-specialized kernels up front, and a
+    # dynamic-batch graph (*_dyn.onnx). With the FP32, *_int8 and *_dynq copies
+    # of each, a run writes 18 files: 3 models x 2 batch variants x 3 precisions.
+    jobs = [
+        (SimpleCNN, (1, 1, 28, 28), "simple_cnn", "SimpleCNN"),  # MNIST-style grayscale
+        (TinyResNet, (1, 3, 224, 224), "tiny_resnet", "TinyResNet"),  # ImageNet-style RGB
+        (TinyMobileNet, (1, 3, 224, 224), "tiny_mobilenet", "TinyMobileNet"),  # Efficient RGB
+    ]
 
-    # 3. Tiny MobileNet (efficient)
-    print("\n3. Creating TinyMobileNet (efficient RGB)...")
-    tiny_mobilenet = TinyMobileNet()
-    export_model(tiny_mobilenet, dummy_imagenet, "tiny_mobilenet.onnx", "TinyMobileNet")
+    # The models share no state, so export them in separate processes
+    # (not threads, which would serialize on the GIL around the tracer)
+    with ProcessPoolExecutor(max_workers=len(jobs)) as executor:
+        list(executor.map(export_variants, jobs))
 
     print("\n" + "="*60)
     print("✅ All models created successfully!")
     print("="*60)
     print("\nThese models are:")
     print("  • Compatible with ONNX Runtime opset 12")
+    print("  • Exported as fixed batch-1 (<name>.onnx) and dynamic-batch (<name>_dyn.onnx) graphs")
+    print("  • Shipped as FP32 plus statically (*_int8.onnx) and weight-only")
+    print("    dynamically (*_dynq.onnx) quantized INT8 copies (18 files in total)")
     print("  • Small and fast for demo purposes")
     print("  • Guaranteed to work (no download/parsing issues)")
     print("  • Based on industry-standard architectures")